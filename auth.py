@@ -0,0 +1,122 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from functools import wraps
+
+import jwt
+import orjson
+from flask import Response, g, request
+
+logger = logging.getLogger(__name__)
+
+# The 401 bodies never vary, so serialize them once at import instead of
+# running jsonify on every rejected request.
+_AUTH_REQUIRED = orjson.dumps({"error": "Authorization required"})
+_INVALID_TOKEN = orjson.dumps({"error": "Invalid or expired token"})
+
+
+def _unauthorized(body):
+    return Response(body, status=401, mimetype="application/json")
+
+
+@dataclass(frozen=True, slots=True)
+class CurrentUser:
+    """Just the identity fields handlers actually read — no __dict__,
+    no pydantic model hanging off every request."""
+
+    id: str
+    email: str | None = None
+
+# Supabase signs access tokens with the project's JWT secret (HS256), so
+# they can be verified here in microseconds instead of letting a bad
+# token ride all the way to a rejected query. Optional: without the
+# secret configured, verification is skipped and RLS remains the
+# authority on every call.
+_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+
+# Decoded-claims cache: a session re-presents the same token for up to
+# an hour, so the HMAC verification only runs the first time a token is
+# seen. Keys are SHA-256 digests, never raw tokens, and expiry is
+# re-checked on every hit so a cached entry can't outlive its token.
+_CLAIMS_CACHE_MAX = 4096
+_claims_cache = {}
+_claims_cache_lock = threading.Lock()
+
+
+def _verify(token):
+    if not _JWT_SECRET:
+        return None
+
+    digest = hashlib.sha256(token.encode()).digest()
+    with _claims_cache_lock:
+        claims = _claims_cache.get(digest)
+    if claims is not None:
+        if claims["exp"] <= time.time():
+            with _claims_cache_lock:
+                _claims_cache.pop(digest, None)
+            raise jwt.ExpiredSignatureError("Token has expired")
+        return claims
+
+    claims = jwt.decode(
+        token,
+        _JWT_SECRET,
+        algorithms=["HS256"],
+        audience="authenticated",
+        options={"require": ["exp", "sub"]},
+    )
+    with _claims_cache_lock:
+        if len(_claims_cache) >= _CLAIMS_CACHE_MAX:
+            _claims_cache.clear()
+        _claims_cache[digest] = claims
+    return claims
+
+
+def authenticate(auth_header):
+    """Scope the caller's access token to the current request.
+
+    The token is stashed on flask.g and injected into outbound Supabase
+    calls at send time by the shared sessions' request hook, so binding
+    a caller never mutates process-wide client state and concurrent
+    requests cannot see each other's credentials.
+    """
+    token = auth_header.removeprefix("Bearer ")
+    claims = _verify(token)
+    g.supabase_token = token
+    g.jwt_claims = claims
+    g.current_user = (
+        CurrentUser(id=claims["sub"], email=claims.get("email"))
+        if claims
+        else None
+    )
+    return token
+
+
+def require_auth(fn):
+    """Route decorator: reject unauthenticated requests and bind the
+    caller's token before the view runs, so controllers never touch the
+    Authorization header themselves."""
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        # CORS preflights carry no Authorization header by design; answer
+        # them before any auth work so a preflight never touches Supabase.
+        if request.method == "OPTIONS":
+            return "", 204
+
+        auth_header = request.headers.get("Authorization")
+        if not auth_header:
+            return _unauthorized(_AUTH_REQUIRED)
+        try:
+            authenticate(auth_header)
+        except jwt.InvalidTokenError:
+            # Routine rejection (expired/garbage token) — no traceback.
+            return _unauthorized(_INVALID_TOKEN)
+        except Exception:
+            logger.exception("Authentication failed")
+            return _unauthorized(_INVALID_TOKEN)
+        return fn(*args, **kwargs)
+
+    return wrapper
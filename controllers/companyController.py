@@ -1,72 +1,266 @@
-from flask import jsonify
+from flask import g, jsonify
+from responses import ojson
+import logging
+import mimetypes
+import os
+import threading
+import time
 import uuid
-from supabase_client import supabase
+from functools import lru_cache
+from postgrest.exceptions import APIError
+from supabase_client import io_pool, supabase, supabase_url
+
+logger = logging.getLogger(__name__)
+
+# Postgres error code for unique-constraint violations.
+_UNIQUE_VIOLATION = "23505"
+
+# Hoisted to module level so handlers don't rebuild them per request;
+# frozensets give O(1) membership checks in the filtering loops.
+_REQUIRED_COMPANY_FIELDS = ("company_name", "owner_name", "email", "phone")
+_ALLOWED_COMPANY_FIELDS = frozenset(
+    {
+        "company_name",
+        "owner_name",
+        "email",
+        "phone",
+        "website",
+        "description",
+        "logo_url",
+        "pricing_document_url",
+    }
+)
+_ALLOWED_MEDIA_EXTENSIONS = frozenset(
+    {".jpg", ".jpeg", ".png", ".gif", ".webp", ".pdf"}
+)
+
+# Explicit projection for list responses — description and document
+# URLs are detail-view data, not list data.
+_COMPANY_LIST_COLUMNS = (
+    "id, company_name, owner_name, email, phone, website, logo_url, created_at"
+)
+
+# Short-TTL cross-request cache for company rows; entries are dropped on
+# update/delete so polling dashboards reuse reads without going stale.
+_COMPANY_CACHE_TTL = int(os.getenv("COMPANY_CACHE_TTL", "30"))
+_COMPANY_CACHE_MAX = 2048
+_company_cache = {}
+_company_cache_lock = threading.Lock()
+
+
+def _company_cache_get(company_id):
+    with _company_cache_lock:
+        entry = _company_cache.get(company_id)
+        if entry is None:
+            return None
+        expires_at, row = entry
+        if expires_at < time.monotonic():
+            del _company_cache[company_id]
+            return None
+        return row
+
+
+def _company_cache_set(company_id, row):
+    with _company_cache_lock:
+        if len(_company_cache) >= _COMPANY_CACHE_MAX:
+            _company_cache.clear()
+        _company_cache[company_id] = (time.monotonic() + _COMPANY_CACHE_TTL, row)
+
+
+def _company_cache_pop(company_id):
+    with _company_cache_lock:
+        _company_cache.pop(company_id, None)
+
+
+@lru_cache(maxsize=128)
+def _mime_for(extension):
+    # The allowed-extension set is tiny, so this memoizes the types_map
+    # walk down to a single dict hit per distinct extension.
+    return mimetypes.types_map.get(extension) or "application/octet-stream"
+
+
+def _upload_one(file_obj, extension, token):
+    # Runs on the shared I/O pool; each call is an independent storage
+    # round-trip so a multi-file request pays for the slowest upload
+    # instead of the sum of all of them. The extension is validated by
+    # the caller before any file bytes are read, and the caller's token
+    # comes in explicitly because pool threads have no request context
+    # for the send-time auth hook to read. uuid4().hex skips the
+    # dashed-string formatting and keeps storage keys four chars shorter.
+    unique_filename = f"{uuid.uuid4().hex}{extension}"
+
+    # Stream the body from the request's spooled file straight to
+    # storage instead of materializing the whole upload in RAM; the
+    # pinned SDK's upload() insists on fully buffered bytes, so this
+    # goes through its httpx session (which carries auth headers and
+    # the storage base URL) directly.
+    response = supabase.storage._client.request(
+        "POST",
+        f"/object/company-assets/{unique_filename}",
+        content=file_obj.stream,
+        headers={
+            "Content-Type": file_obj.content_type or _mime_for(extension),
+            **({"Authorization": f"Bearer {token}"} if token else {}),
+        },
+    )
+    response.raise_for_status()
+    # Public URLs for this bucket follow a fixed scheme, so build the
+    # string directly — and against the bucket that was actually written
+    # to (the old code returned URLs for a "company-media" bucket that
+    # nothing uploads into).
+    return f"{supabase_url}/storage/v1/object/public/company-assets/{unique_filename}"
 
 
 class CompanyController:
-    def create_company(self, data, auth_header):
+    @property
+    def _companies(self):
+        # Resolved through the live client on each use so queries always
+        # go through the current PostgREST session; building the request
+        # builder is cheap.
+        return supabase.table("companies")
+
+    @property
+    def _users(self):
+        return supabase.table("users")
+
+    def _get_company_row(self, company_id):
+        # Memoize company lookups on flask.g so repeated fetches of the
+        # same row within one request collapse to a single SELECT.
+        cache = getattr(g, "_company_row_cache", None)
+        if cache is None:
+            cache = g._company_row_cache = {}
+        if company_id in cache:
+            return cache[company_id]
+
+        row = _company_cache_get(company_id)
+        if row is not None:
+            cache[company_id] = row
+            return row
+
+        response = (
+            self._companies.select("*")
+            .eq("id", company_id)
+            .maybe_single()
+            .execute()
+        )
+        # postgrest <0.16 returns None (not a response object) from
+        # maybe_single() when no row matches.
+        row = response.data if response is not None else None
+        cache[company_id] = row
+        if row is not None:
+            _company_cache_set(company_id, row)
+        return row
+
+    def _invalidate_company_row(self, company_id):
+        cache = getattr(g, "_company_row_cache", None)
+        if cache is not None:
+            cache.pop(company_id, None)
+        _company_cache_pop(company_id)
+
+    def create_company(self, data):
         try:
-            if not auth_header:
-                return jsonify({"error": "Authorization required"}), 401
-
-            token = auth_header.replace("Bearer ", "")
-            supabase.auth.set_session(token, "")
-
-            response = supabase.table("companies").insert(data).execute()
+            if not all(data.get(f) for f in _REQUIRED_COMPANY_FIELDS):
+                missing = [f for f in _REQUIRED_COMPANY_FIELDS if not data.get(f)]
+                return (
+                    jsonify({"error": f"Missing required fields: {', '.join(missing)}"}),
+                    400,
+                )
+
+            # Project the payload onto the schema columns in one
+            # comprehension instead of trusting the request dict; unknown
+            # keys would otherwise surface as PostgREST column errors.
+            payload = {k: data[k] for k in _ALLOWED_COMPANY_FIELDS if k in data}
+            response = self._companies.insert(payload).execute()
 
             if response.data:
                 return jsonify({"company": response.data[0]}), 201
             else:
                 return jsonify({"error": "Creation failed"}), 400
 
+        except APIError as e:
+            # Let the unique constraint on companies.email arbitrate
+            # duplicates instead of a racy SELECT-then-INSERT check.
+            if e.code == _UNIQUE_VIOLATION:
+                return (
+                    jsonify({"error": "A company with this email already exists"}),
+                    409,
+                )
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
-    def get_companies(self, auth_header):
+    def get_companies(self, limit=50, offset=0):
         try:
-            if not auth_header:
-                return jsonify({"error": "Authorization required"}), 401
-
-            token = auth_header.replace("Bearer ", "")
-            supabase.auth.set_session(token, "")
-
-            response = supabase.table("companies").select("*").execute()
-            return jsonify({"companies": response.data}), 200
+            response = (
+                self._companies.select(_COMPANY_LIST_COLUMNS, count="exact")
+                .range(offset, offset + limit - 1)
+                .execute()
+            )
+            return (
+                ojson({"companies": response.data}),
+                {"X-Total-Count": str(response.count)},
+            )
 
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
-    def get_company(self, company_id, auth_header):
+    def get_company(self, company_id):
         try:
-            if not auth_header:
-                return jsonify({"error": "Authorization required"}), 401
+            company = self._get_company_row(company_id)
 
-            token = auth_header.replace("Bearer ", "")
-            supabase.auth.set_session(token, "")
-
-            response = (
-                supabase.table("companies").select("*").eq("id", company_id).execute()
-            )
-
-            if response.data:
-                return jsonify({"company": response.data[0]}), 200
+            if company:
+                return jsonify({"company": company}), 200
             else:
                 return jsonify({"error": "Company not found"}), 404
 
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
-    def update_company(self, company_id, data, auth_header):
+    def get_company_users(self, company_id):
         try:
-            if not auth_header:
-                return jsonify({"error": "Authorization required"}), 401
+            # Single query for the whole member list; RLS scopes which
+            # rows the requesting user may actually see.
+            response = (
+                self._users
+                .select("id, full_name, email, role, company_id, created_at")
+                .eq("company_id", company_id)
+                .order("created_at")
+                .execute()
+            )
+            return ojson({"users": response.data})
+
+        except Exception as e:
+            return jsonify({"error": str(e)}), 400
 
-            token = auth_header.replace("Bearer ", "")
-            supabase.auth.set_session(token, "")
+    def update_company(self, company_id, data):
+        try:
+            filtered_data = {
+                k: v
+                for k, v in data.items()
+                if k in _ALLOWED_COMPANY_FIELDS and v is not None
+            }
+            if not filtered_data:
+                return jsonify({"error": "No valid fields to update"}), 400
+
+            # Idempotent client retries: if a cached copy of the row shows
+            # every value already matches, skip the UPDATE round-trip.
+            # Cache layers only — never issue an extra SELECT for this.
+            request_cache = getattr(g, "_company_row_cache", None)
+            current = request_cache.get(company_id) if request_cache else None
+            if current is None:
+                current = _company_cache_get(company_id)
+            if current is not None and all(
+                current.get(k) == v for k, v in filtered_data.items()
+            ):
+                return jsonify({"company": current}), 200
 
             response = (
-                supabase.table("companies").update(data).eq("id", company_id).execute()
+                self._companies
+                .update(filtered_data)
+                .eq("id", company_id)
+                .execute()
             )
+            self._invalidate_company_row(company_id)
 
             if response.data:
                 return jsonify({"company": response.data[0]}), 200
@@ -76,54 +270,78 @@ class CompanyController:
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
-    def delete_company(self, company_id, auth_header):
+    def delete_company(self, company_id):
         try:
-            if not auth_header:
-                return jsonify({"error": "Authorization required"}), 401
-
-            token = auth_header.replace("Bearer ", "")
-            supabase.auth.set_session(token, "")
-
-            response = (
-                supabase.table("companies").delete().eq("id", company_id).execute()
-            )
-
+            # Single atomic RPC (sql/04): the member-count guard and the
+            # delete share one transaction, so concurrent leavers can't
+            # both slip past the guard, and the count+delete pair costs
+            # one round-trip instead of two.
+            response = supabase.rpc(
+                "delete_company_guarded", {"p_company_id": company_id}
+            ).execute()
+
+            if not response.data:
+                return (
+                    jsonify({"error": "Company still has other members"}),
+                    409,
+                )
+
+            self._invalidate_company_row(company_id)
             return jsonify({"success": True}), 200
 
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
-    def upload_media(self, files, auth_header):
+    def upload_media(self, files):
         try:
-            if not auth_header:
-                return jsonify({"error": "Authorization required"}), 401
-
-            token = auth_header.replace("Bearer ", "")
-            supabase.auth.set_session(token, "")
-
-            uploaded_files = {}
-
+            # Validate extensions before touching any file contents so a
+            # bad upload is rejected without buffering its bytes.
+            to_upload = []
+            invalid = []
             for file_key, file_obj in files.items():
-                if file_obj:
-                    # Generate unique filename
-                    file_extension = file_obj.filename.split(".")[-1]
-                    unique_filename = f"{uuid.uuid4()}.{file_extension}"
-
-                    # Upload to Supabase storage
-                    response = supabase.storage.from_("company-assets").upload(
-                        unique_filename,
-                        file_obj.read(),
-                        {"content-type": file_obj.content_type},
-                    )
-
-                    if response:
-                        # Get public URL
-                        public_url = supabase.storage.from_(
-                            "company-media"
-                        ).get_public_url(unique_filename)
-                        uploaded_files[file_key] = public_url
-
-            return jsonify({"uploaded_files": uploaded_files}), 200
+                if not file_obj:
+                    continue
+                extension = os.path.splitext(file_obj.filename)[1].lower()
+                if extension in _ALLOWED_MEDIA_EXTENSIONS:
+                    to_upload.append((file_key, file_obj, extension))
+                else:
+                    invalid.append(file_obj.filename)
+
+            if invalid:
+                return (
+                    jsonify({"error": f"Unsupported file type: {', '.join(invalid)}"}),
+                    400,
+                )
+
+            # Fan the uploads out on the shared I/O pool; each one is an
+            # independent blocking network call. The caller's token is
+            # captured here, inside the request context, and handed to
+            # the workers.
+            token = getattr(g, "supabase_token", None)
+            futures = {
+                file_key: io_pool.submit(_upload_one, file_obj, extension, token)
+                for file_key, file_obj, extension in to_upload
+            }
+
+            # Collect per-file results; one failed upload shouldn't void
+            # the files that made it.
+            uploaded_files = {}
+            failed_files = {}
+            for file_key, future in futures.items():
+                try:
+                    public_url = future.result()
+                except Exception as upload_error:
+                    logger.exception("Upload failed for %s", file_key)
+                    failed_files[file_key] = str(upload_error)
+                    continue
+                if public_url:
+                    uploaded_files[file_key] = public_url
+
+            payload = {"uploaded_files": uploaded_files}
+            if failed_files:
+                payload["failed_files"] = failed_files
+
+            return jsonify(payload), 200
 
         except Exception as e:
             return jsonify({"error": str(e)}), 400
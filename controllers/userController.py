@@ -1,70 +1,225 @@
-from flask import jsonify
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+
+from flask import g, jsonify
+from responses import ojson
 from supabase_client import supabase
 
+logger = logging.getLogger(__name__)
+
+# Short-TTL cache for repeated identical sign-ins (SPA retries, mobile
+# resume) so they skip the provider's password verification round-trip.
+# Keys are HMACs so raw passwords never sit in memory; failures are
+# never cached.
+# Validation field sets are hoisted to module level so handlers don't
+# rebuild them per request; the all() guard short-circuits on the first
+# missing field and the error path alone pays for the full scan.
+_REQUIRED_REGISTER_FIELDS = ("email", "password", "full_name")
+_REQUIRED_LOGIN_FIELDS = ("email", "password")
+
+# Explicit projection for list responses — no SELECT * shipping columns
+# nobody renders.
+_USER_LIST_COLUMNS = "id, full_name, email, role, company_id, created_at"
+
+# Keys that must never reach a log line.
+_SECRET_FIELDS = frozenset({"password", "access_token", "refresh_token"})
+
+
+def _safe(data):
+    # Log-safe view of a request payload: credentials and tokens are
+    # dropped before the dict is ever stringified.
+    return {k: v for k, v in data.items() if k not in _SECRET_FIELDS}
+
+# Failed logins are padded to this duration so response timing can't
+# distinguish unknown emails (provider short-circuits) from wrong
+# passwords (full hash verification).
+_LOGIN_FAILURE_LATENCY = float(os.getenv("LOGIN_FAILURE_LATENCY", "0.45"))
+
+_LOGIN_CACHE_TTL = int(os.getenv("LOGIN_CACHE_TTL", "120"))
+_LOGIN_CACHE_MAX = 10_000
+_login_cache = {}
+_login_cache_lock = threading.Lock()
+_login_cache_secret = os.urandom(32)
+
+# Short-TTL cross-request cache for profile rows, mirroring the company
+# cache: detail-view navigations reuse reads for a few seconds, and
+# entries are dropped on update/delete so writes are never masked.
+# Entries are keyed by (requester, user_id) so a row visible to one
+# caller under RLS is never served from cache to a different caller.
+_USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "30"))
+_USER_CACHE_MAX = 2048
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+
+
+def _requester_key():
+    # Digest of the caller's token, so the cache scopes by requester
+    # without holding raw tokens; None (no token bound) disables the
+    # cross-request cache for the lookup.
+    token = getattr(g, "supabase_token", None)
+    if token is None:
+        return None
+    return hashlib.sha256(token.encode()).digest()
+
+
+def _user_cache_get(requester, user_id):
+    with _user_cache_lock:
+        entry = _user_cache.get((requester, user_id))
+        if entry is None:
+            return None
+        expires_at, profile = entry
+        if expires_at < time.monotonic():
+            del _user_cache[(requester, user_id)]
+            return None
+        return profile
+
+
+def _user_cache_set(requester, user_id, profile):
+    with _user_cache_lock:
+        if len(_user_cache) >= _USER_CACHE_MAX:
+            _user_cache.clear()
+        _user_cache[(requester, user_id)] = (
+            time.monotonic() + _USER_CACHE_TTL,
+            profile,
+        )
+
+
+def _user_cache_pop(user_id):
+    # Writes must clear the row for every requester that cached it.
+    with _user_cache_lock:
+        for key in [k for k in _user_cache if k[1] == user_id]:
+            del _user_cache[key]
+
+
+def _serialize_session(session):
+    # Single place that turns a gotrue Session into the token dict we
+    # return to clients. model_dump does the field coercion in C and
+    # emits JSON-safe values, so the serializer needs no second pass.
+    if session is None:
+        return None
+    return session.model_dump(mode="json", include={"access_token", "refresh_token"})
+
+
+def _pad_failure_latency(started_at):
+    time.sleep(max(0.0, _LOGIN_FAILURE_LATENCY - (time.monotonic() - started_at)))
+
+
+def _login_cache_key(email, password):
+    return hmac.new(
+        _login_cache_secret, f"{email}:{password}".encode(), "sha256"
+    ).digest()
+
+
+def _login_cache_get(key):
+    with _login_cache_lock:
+        entry = _login_cache.get(key)
+        if entry is None:
+            return None
+        expires_at, payload = entry
+        if expires_at < time.monotonic():
+            del _login_cache[key]
+            return None
+        return payload
+
+
+def _login_cache_set(key, payload):
+    with _login_cache_lock:
+        if len(_login_cache) >= _LOGIN_CACHE_MAX:
+            _login_cache.clear()
+        _login_cache[key] = (time.monotonic() + _LOGIN_CACHE_TTL, payload)
+
 
 class UserController:
+    @property
+    def _users(self):
+        # Resolved through the live client on each use so queries always
+        # go through the current PostgREST session; building the request
+        # builder is cheap.
+        return supabase.table("users")
+
+    def _get_user_profile(self, user_id):
+        # Memoize profile lookups on flask.g so repeated fetches within one
+        # request collapse to a single SELECT.
+        cache = getattr(g, "_user_profile_cache", None)
+        if cache is None:
+            cache = g._user_profile_cache = {}
+        if user_id in cache:
+            return cache[user_id]
+
+        requester = _requester_key()
+        if requester is not None:
+            profile = _user_cache_get(requester, user_id)
+            if profile is not None:
+                cache[user_id] = profile
+                return profile
+
+        # Embed the company through the users.company_id foreign key so
+        # profile + company arrive in one round-trip instead of two.
+        response = (
+            self._users.select("id, full_name, email, company_id, role, company:companies(*)")
+            .eq("id", user_id)
+            .maybe_single()
+            .execute()
+        )
+        # postgrest <0.16 returns None (not a response object) from
+        # maybe_single() when no row matches.
+        profile = response.data if response is not None else None
+        cache[user_id] = profile
+        if profile is not None and requester is not None:
+            _user_cache_set(requester, user_id, profile)
+        return profile
+
+    def _invalidate_user_profile(self, user_id):
+        cache = getattr(g, "_user_profile_cache", None)
+        if cache is not None:
+            cache.pop(user_id, None)
+        _user_cache_pop(user_id)
+
     def register(self, data):
         try:
-            print("Registration data received:", data)
+            logger.debug("Registration data received: %s", _safe(data))
+
+            if not all(data.get(f) for f in _REQUIRED_REGISTER_FIELDS):
+                missing = [f for f in _REQUIRED_REGISTER_FIELDS if not data.get(f)]
+                return (
+                    jsonify({"error": f"Missing required fields: {', '.join(missing)}"}),
+                    400,
+                )
+
+            email = data.get("email")
+            full_name = data.get("full_name")
 
             # Register user with Supabase Auth
             auth_response = supabase.auth.sign_up(
                 {
-                    "email": data.get("email"),
+                    "email": email,
                     "password": data.get("password"),
-                    "options": {"data": {"full_name": data.get("full_name")}},
+                    "options": {"data": {"full_name": full_name}},
                 }
             )
 
-            print("Auth response:", auth_response)
-
             if auth_response.user:
-                # The trigger should automatically create the user record
-                # But let's verify and create manually if needed
-                try:
-                    # Check if user was created by trigger
-                    user_check = (
-                        supabase.table("users")
-                        .select("*")
-                        .eq("id", auth_response.user.id)
-                        .execute()
-                    )
-
-                    if not user_check.data:
-                        # Trigger didn't work, create manually
-                        user_data = {
-                            "id": auth_response.user.id,
-                            "full_name": data.get("full_name"),
-                            "email": data.get("email"),
-                            "role": "member",
-                        }
-
-                        user_response = (
-                            supabase.table("users").insert(user_data).execute()
-                        )
-                        user_record = user_response.data[0]
-                    else:
-                        user_record = user_check.data[0]
-
-                except Exception as user_error:
-                    print("User table error:", user_error)
-                    # If there's an issue with user table, still return auth success
-                    user_record = {
-                        "id": auth_response.user.id,
-                        "email": data.get("email"),
-                        "full_name": data.get("full_name"),
-                        "role": "member",
-                    }
+                # The on_auth_user_created trigger (sql/02_setup_triggers.sql)
+                # creates the users row inside the same signup transaction, so
+                # signup is a single round-trip; build the response locally
+                # instead of re-reading what the trigger just wrote.
+                user_record = {
+                    "id": auth_response.user.id,
+                    "email": email,
+                    "full_name": full_name,
+                    "role": "member",
+                }
 
                 return (
                     jsonify(
                         {
                             "success": True,
                             "user": user_record,
-                            "auth": {
-                                "access_token": auth_response.session.access_token,
-                                "refresh_token": auth_response.session.refresh_token,
-                            },
+                            "auth": _serialize_session(auth_response.session),
                         }
                     ),
                     201,
@@ -73,100 +228,102 @@ class UserController:
                 return jsonify({"error": "Registration failed"}), 400
 
         except Exception as e:
-            print("Registration error:", str(e))
+            logger.exception("Registration failed")
             return jsonify({"error": str(e)}), 400
 
     def login(self, data):
+        started_at = time.monotonic()
         try:
-            print("Login attempt for:", data.get("email"))
+            if not all(data.get(f) for f in _REQUIRED_LOGIN_FIELDS):
+                missing = [f for f in _REQUIRED_LOGIN_FIELDS if not data.get(f)]
+                return (
+                    jsonify({"error": f"Missing required fields: {', '.join(missing)}"}),
+                    400,
+                )
+
+            email = data.get("email")
+            password = data.get("password")
+
+            logger.debug("Login attempt for %s", email)
+
+            cache_key = _login_cache_key(email, password)
+            cached = _login_cache_get(cache_key)
+            if cached is not None:
+                return jsonify(cached), 200
 
             response = supabase.auth.sign_in_with_password(
-                {"email": data.get("email"), "password": data.get("password")}
+                {"email": email, "password": password}
             )
 
             if response.user:
-                # Get user data from users table
-                user_data = (
-                    supabase.table("users")
-                    .select("*")
-                    .eq("id", response.user.id)
-                    .execute()
-                )
+                # Bind the fresh token before reading the profile: login
+                # isn't behind require_auth, so nothing else puts a token
+                # on flask.g, and without it the SELECT below would run
+                # as the anon key and match zero rows under RLS.
+                if response.session:
+                    g.supabase_token = response.session.access_token
 
-                print("User data found:", user_data.data)
-
-                return (
-                    jsonify(
-                        {
-                            "success": True,
-                            "user": (
-                                user_data.data[0]
-                                if user_data.data
-                                else {
-                                    "id": response.user.id,
-                                    "email": response.user.email,
-                                    "full_name": response.user.user_metadata.get(
-                                        "full_name", ""
-                                    ),
-                                    "role": "member",
-                                }
+                # Get user data from users table
+                user_profile = self._get_user_profile(response.user.id)
+
+                payload = {
+                    "success": True,
+                    "user": (
+                        user_profile
+                        if user_profile
+                        else {
+                            "id": response.user.id,
+                            "email": response.user.email,
+                            "full_name": response.user.user_metadata.get(
+                                "full_name", ""
                             ),
-                            "auth": {
-                                "access_token": response.session.access_token,
-                                "refresh_token": response.session.refresh_token,
-                            },
+                            "role": "member",
                         }
                     ),
-                    200,
-                )
+                    "auth": _serialize_session(response.session),
+                }
+                _login_cache_set(cache_key, payload)
+                return jsonify(payload), 200
             else:
+                _pad_failure_latency(started_at)
                 return jsonify({"error": "Login failed"}), 401
 
         except Exception as e:
-            print("Login error:", str(e))
+            logger.exception("Login failed")
+            _pad_failure_latency(started_at)
             return jsonify({"error": str(e)}), 401
 
-    def get_users(self, auth_header):
+    def get_users(self, limit=50, offset=0):
         try:
-            if not auth_header:
-                return jsonify({"error": "Authorization required"}), 401
-
-            token = auth_header.replace("Bearer ", "")
-            supabase.auth.set_session(token, "")
-
-            response = supabase.table("users").select("*").execute()
-            return jsonify({"users": response.data}), 200
+            response = (
+                self._users.select(_USER_LIST_COLUMNS, count="exact")
+                .range(offset, offset + limit - 1)
+                .execute()
+            )
+            return (
+                ojson({"users": response.data}),
+                {"X-Total-Count": str(response.count)},
+            )
 
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
-    def get_user(self, user_id, auth_header):
+    def get_user(self, user_id):
         try:
-            if not auth_header:
-                return jsonify({"error": "Authorization required"}), 401
-
-            token = auth_header.replace("Bearer ", "")
-            supabase.auth.set_session(token, "")
-
-            response = supabase.table("users").select("*").eq("id", user_id).execute()
+            profile = self._get_user_profile(user_id)
 
-            if response.data:
-                return jsonify({"user": response.data[0]}), 200
+            if profile:
+                return jsonify({"user": profile}), 200
             else:
                 return jsonify({"error": "User not found"}), 404
 
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
-    def update_user(self, user_id, data, auth_header):
+    def update_user(self, user_id, data):
         try:
-            if not auth_header:
-                return jsonify({"error": "Authorization required"}), 401
-
-            token = auth_header.replace("Bearer ", "")
-            supabase.auth.set_session(token, "")
-
-            response = supabase.table("users").update(data).eq("id", user_id).execute()
+            response = self._users.update(data).eq("id", user_id).execute()
+            self._invalidate_user_profile(user_id)
 
             if response.data:
                 return jsonify({"user": response.data[0]}), 200
@@ -176,15 +333,10 @@ class UserController:
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
-    def delete_user(self, user_id, auth_header):
+    def delete_user(self, user_id):
         try:
-            if not auth_header:
-                return jsonify({"error": "Authorization required"}), 401
-
-            token = auth_header.replace("Bearer ", "")
-            supabase.auth.set_session(token, "")
-
-            response = supabase.table("users").delete().eq("id", user_id).execute()
+            response = self._users.delete().eq("id", user_id).execute()
+            self._invalidate_user_profile(user_id)
 
             return jsonify({"success": True}), 200
 
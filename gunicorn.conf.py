@@ -0,0 +1,23 @@
+# Patch before anything else loads: with preload_app the master imports
+# the app (ssl, httpx pools, locks, queues) ahead of the gevent worker's
+# own patching, and gevent cannot safely patch modules already in use.
+# This file executes in the master before the app, so patching here
+# keeps master and workers consistent.
+from gevent import monkey
+
+monkey.patch_all()
+
+wsgi_app = "server:app"
+worker_class = "gevent"
+workers = 4
+worker_connections = 1000
+# Build the app once in the master and share it copy-on-write.
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Threads don't survive the fork; give each worker its own log
+    # queue listener so records keep draining.
+    from server import start_log_listener
+
+    start_log_listener()
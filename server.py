@@ -1,90 +1,177 @@
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+import orjson
 from flask import Flask, request, jsonify
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from controllers.userController import UserController
 from controllers.companyController import CompanyController
+from auth import require_auth
+
+
+class ORJSONProvider(JSONProvider):
+    """JSON provider backed by orjson's C serializer.
+
+    Walks the object graph once and handles datetime/UUID natively;
+    anything exotic falls back to str().
+    """
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=str).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+# Logging is configured once here, at app startup; library modules only
+# call logging.getLogger(__name__) and use lazy %-style arguments.
+# Records go through an in-memory queue so request handlers never block
+# on stdout flushes — the listener thread does the actual writing.
+_log_queue = queue.SimpleQueue()
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(
+    logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+)
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    handlers=[QueueHandler(_log_queue)],
+)
+
+
+def start_log_listener():
+    # Called at import and again from gunicorn's post_fork hook: the
+    # listener thread does not survive the worker fork under
+    # preload_app, so each worker restarts its own.
+    QueueListener(_log_queue, _log_handler).start()
+
+
+start_log_listener()
 
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
+# Oversized bodies are rejected with 413 straight from Content-Length /
+# while spooling — an integer compare, no handler ever reads an upload
+# just to size it.
+app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_CONTENT_LENGTH_MB", "10")) << 20
 CORS(app)
 
+
+@app.after_request
+def no_store_auth_responses(response):
+    # Auth responses carry access/refresh tokens; make sure no shared
+    # cache or proxy ever persists or cross-serves them.
+    if request.path.startswith("/auth/"):
+        response.headers["Cache-Control"] = "private, no-store"
+        response.headers["Vary"] = "Authorization"
+    return response
+
 user_controller = UserController()
 company_controller = CompanyController()
 
 
+def _request_data():
+    # Parse the body once (Werkzeug caches the result) and fall back to
+    # form data instead of raising on a missing/odd Content-Type the way
+    # request.json does.
+    return request.get_json(silent=True) or request.form
+
+
+def _pagination():
+    # ?limit= / ?offset= with a server-side cap so list endpoints stay
+    # bounded regardless of what the client asks for.
+    try:
+        limit = int(request.args.get("limit", 50))
+        offset = int(request.args.get("offset", 0))
+    except ValueError:
+        return 50, 0
+    return min(max(limit, 1), 200), max(offset, 0)
+
+
 # Auth routes
 @app.route("/auth/register", methods=["POST"])
 def register():
-    return user_controller.register(request.json)
+    return user_controller.register(_request_data())
 
 
 @app.route("/auth/login", methods=["POST"])
 def login():
-    return user_controller.login(request.json)
+    return user_controller.login(_request_data())
 
 
 # User CRUD routes
 @app.route("/users", methods=["GET"])
+@require_auth
 def get_users():
-    return user_controller.get_users(request.headers.get("Authorization"))
+    return user_controller.get_users(*_pagination())
 
 
 @app.route("/users/<user_id>", methods=["GET"])
+@require_auth
 def get_user(user_id):
-    return user_controller.get_user(user_id, request.headers.get("Authorization"))
+    return user_controller.get_user(user_id)
 
 
 @app.route("/users/<user_id>", methods=["PUT"])
+@require_auth
 def update_user(user_id):
-    return user_controller.update_user(
-        user_id, request.json, request.headers.get("Authorization")
-    )
+    return user_controller.update_user(user_id, _request_data())
 
 
 @app.route("/users/<user_id>", methods=["DELETE"])
+@require_auth
 def delete_user(user_id):
-    return user_controller.delete_user(user_id, request.headers.get("Authorization"))
+    return user_controller.delete_user(user_id)
 
 
 # Company CRUD routes
 @app.route("/companies", methods=["POST"])
+@require_auth
 def create_company():
-    return company_controller.create_company(
-        request.json, request.headers.get("Authorization")
-    )
+    return company_controller.create_company(_request_data())
 
 
 @app.route("/companies", methods=["GET"])
+@require_auth
 def get_companies():
-    return company_controller.get_companies(request.headers.get("Authorization"))
+    return company_controller.get_companies(*_pagination())
 
 
 @app.route("/companies/<company_id>", methods=["GET"])
+@require_auth
 def get_company(company_id):
-    return company_controller.get_company(
-        company_id, request.headers.get("Authorization")
-    )
+    return company_controller.get_company(company_id)
+
+
+@app.route("/companies/<company_id>/users", methods=["GET"])
+@require_auth
+def get_company_users(company_id):
+    return company_controller.get_company_users(company_id)
 
 
 @app.route("/companies/<company_id>", methods=["PUT"])
+@require_auth
 def update_company(company_id):
-    return company_controller.update_company(
-        company_id, request.json, request.headers.get("Authorization")
-    )
+    return company_controller.update_company(company_id, _request_data())
 
 
 @app.route("/companies/<company_id>", methods=["DELETE"])
+@require_auth
 def delete_company(company_id):
-    return company_controller.delete_company(
-        company_id, request.headers.get("Authorization")
-    )
+    return company_controller.delete_company(company_id)
 
 
 # Media upload route
 @app.route("/upload", methods=["POST"])
+@require_auth
 def upload_media():
-    return company_controller.upload_media(
-        request.files, request.headers.get("Authorization")
-    )
+    return company_controller.upload_media(request.files)
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    # Local development entry point only; production runs under gunicorn
+    # (see Procfile). Debug mode (reloader + single-threaded server) is
+    # opt-in rather than hardcoded.
+    app.run(debug=os.getenv("FLASK_DEBUG") == "1")
@@ -48,6 +48,22 @@ CREATE TRIGGER on_auth_user_created
     AFTER INSERT ON auth.users
     FOR EACH ROW EXECUTE FUNCTION public.handle_new_user();
 
+-- Function to get a user's company id
+-- SECURITY DEFINER so RLS policies on the users table can reference it
+-- without recursing into their own table
+CREATE OR REPLACE FUNCTION public.get_user_company_id(user_id UUID)
+RETURNS UUID AS $$
+DECLARE
+    user_company UUID;
+BEGIN
+    SELECT company_id INTO user_company
+    FROM public.users
+    WHERE id = user_id;
+
+    RETURN user_company;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
 -- Function to get user role
 CREATE OR REPLACE FUNCTION public.get_user_role(user_id UUID)
 RETURNS TEXT AS $$
@@ -31,22 +31,36 @@ CREATE POLICY "Users can update their own profile" ON users
 CREATE POLICY "Users can insert their own profile" ON users
     FOR INSERT WITH CHECK (auth.uid() = id);
 
+-- Users can view members of their own company; goes through the
+-- SECURITY DEFINER helper from 02 because a direct subselect on users
+-- inside a users policy would recurse
+CREATE POLICY "Users can view company members" ON users
+    FOR SELECT USING (
+        company_id IS NOT NULL
+        AND company_id = public.get_user_company_id(auth.uid())
+    );
+
 -- Companies table policies
 -- Authenticated users can view any company (simplified for now)
 CREATE POLICY "Authenticated users can view companies" ON companies
     FOR SELECT USING (auth.role() = 'authenticated');
 
--- Authenticated users can update companies (we'll add business logic checks in the app)
-CREATE POLICY "Authenticated users can update companies" ON companies
-    FOR UPDATE USING (auth.role() = 'authenticated');
+-- Users can only update their own company; the check runs inside the
+-- UPDATE itself so no extra authorization round-trip is needed in the app
+CREATE POLICY "Users can update their company" ON companies
+    FOR UPDATE USING (
+        id = (SELECT company_id FROM users WHERE id = auth.uid())
+    );
 
 -- Authenticated users can create companies
 CREATE POLICY "Authenticated users can create companies" ON companies
     FOR INSERT WITH CHECK (auth.role() = 'authenticated');
 
--- Authenticated users can delete companies (we'll add business logic checks in the app)
-CREATE POLICY "Authenticated users can delete companies" ON companies
-    FOR DELETE USING (auth.role() = 'authenticated');
+-- Users can only delete their own company
+CREATE POLICY "Users can delete their company" ON companies
+    FOR DELETE USING (
+        id = (SELECT company_id FROM users WHERE id = auth.uid())
+    );
 
 -- Verify the database policies were created
 SELECT schemaname, tablename, policyname, permissive, roles, cmd, qual 
@@ -0,0 +1,43 @@
+-- Database Setup for NailedIt Quote AI
+-- Step 4: Create RPC Functions
+
+-- Deletes a company only while it has at most one remaining member.
+-- The count and the delete run inside one transaction, so two members
+-- leaving at the same time cannot both observe "last member", and the
+-- API pays one round-trip instead of a count query plus a delete.
+--
+-- SECURITY DEFINER so the member count sees every row: under invoker
+-- rights the users SELECT policies would filter the count down to the
+-- caller's own row and the guard could never trip. Authorization is
+-- the explicit membership check below instead.
+CREATE OR REPLACE FUNCTION public.delete_company_guarded(p_company_id UUID)
+RETURNS BOOLEAN AS $$
+DECLARE
+    member_count INTEGER;
+BEGIN
+    -- Only members of the company may delete it.
+    IF NOT EXISTS (
+        SELECT 1 FROM public.users
+        WHERE id = auth.uid() AND company_id = p_company_id
+    ) THEN
+        RAISE EXCEPTION 'Not a member of this company';
+    END IF;
+
+    SELECT COUNT(*) INTO member_count
+    FROM public.users
+    WHERE company_id = p_company_id;
+
+    IF member_count > 1 THEN
+        RETURN FALSE;
+    END IF;
+
+    DELETE FROM public.companies WHERE id = p_company_id;
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Manual verification:
+--   1. As a member of a two-member company, call
+--      select delete_company_guarded('<company id>');  -- returns false
+--   2. Remove the other member, call again;            -- returns true
+--   3. As a non-member, the call must raise an exception.
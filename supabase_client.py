@@ -1,20 +1,100 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from flask import g, has_request_context
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Shared executor for fanning out independent blocking Supabase calls
+# (storage uploads, parallel queries). Sized generously because the
+# threads spend their time waiting on the network, not the CPU.
+io_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SUPABASE_IO_WORKERS", "32")),
+    thread_name_prefix="supa",
+)
+
+# Clients are pooled by (url, key) and built once at import time so every
+# request shares the same underlying HTTP session instead of paying
+# connection setup on each call.
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+# Keep-alive tuning for the Supabase HTTP sessions: persistent
+# connections skip the TCP+TLS handshake on every call, and HTTP/2 lets
+# concurrent queries multiplex over the same warm socket instead of
+# each claiming a connection.
+_HTTP_LIMITS = httpx.Limits(
+    max_connections=128, max_keepalive_connections=64, keepalive_expiry=30
+)
+
+# Tight connect bound so a burst against an unreachable endpoint fails
+# in 2s instead of tying workers up for the full request timeout.
+_HTTP_TIMEOUT = httpx.Timeout(10.0, connect=2.0)
+
+
+def _inject_request_token(outbound: httpx.Request) -> None:
+    # Send-time auth binding: each outbound Supabase call picks up the
+    # access token of the Flask request it belongs to. Session headers
+    # stay at the anon key, so concurrent requests can't bleed
+    # credentials into each other through shared client state.
+    if not has_request_context():
+        return
+    token = getattr(g, "supabase_token", None)
+    if token:
+        outbound.headers["Authorization"] = f"Bearer {token}"
 
-class SupabaseSingleton:
-    _instance = None
 
-    def __new__(cls):
-        if cls._instance is None:
-            url = os.getenv("SUPABASE_URL")
-            key = os.getenv("SUPABASE_ANON_KEY")
-            cls._instance = create_client(url, key)
-        return cls._instance
+def _tuned_session(old: httpx.Client) -> httpx.Client:
+    return httpx.Client(
+        base_url=old.base_url,
+        headers=old.headers,
+        timeout=_HTTP_TIMEOUT,
+        http2=True,
+        limits=_HTTP_LIMITS,
+        event_hooks={"request": [_inject_request_token]},
+    )
 
 
+def _tune_http_pool(client: Client) -> None:
+    # The pinned SDK builds its HTTP sessions without exposing pool
+    # limits or HTTP/2, so rebuild them with the same base_url/headers
+    # and our transport settings applied. PostgREST and storage keep
+    # separate sessions in the SDK, so both are rebuilt.
+    client.postgrest.session = _tuned_session(client.postgrest.session)
+    storage = client.storage
+    storage._client = _tuned_session(storage._client)
+
+
+def get_client(url: str, key: str) -> Client:
+    # Locked so two threads racing on first use can't each build (and
+    # tune) their own client for the same credentials.
+    with _clients_lock:
+        client = _clients.get((url, key))
+        if client is None:
+            client = _clients[(url, key)] = create_client(url, key)
+            _tune_http_pool(client)
+            # Drop the SDK's auth listener: it tears down and rebuilds the
+            # tuned sessions on every sign-in and bakes the last user's
+            # token into the rebuilt headers — exactly the shared mutable
+            # auth state the send-time hook exists to avoid.
+            client.auth._state_change_emitters.clear()
+    return client
+
+
+# Exported alongside the client so callers can build storage URLs and
+# the like without a second getenv.
+supabase_url = os.getenv("SUPABASE_URL")
+
 # Create and export the supabase client instance
-supabase: Client = SupabaseSingleton()
+supabase: Client = get_client(supabase_url, os.getenv("SUPABASE_ANON_KEY"))
+
+# Optional service-role client for privileged operations (bypasses RLS).
+_service_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+supabase_admin: Client = (
+    get_client(supabase_url, _service_key) if _service_key else None
+)
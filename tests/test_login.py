@@ -0,0 +1,75 @@
+import os
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("supabase")
+
+# The app builds its Supabase clients at import time; give it inert
+# settings so importing server never needs a real project.
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "test-anon-key")
+
+
+@pytest.fixture
+def client():
+    import server
+
+    server.app.config["TESTING"] = True
+    with server.app.test_client() as test_client:
+        yield test_client
+
+
+def test_login_binds_fresh_token_before_profile_read(client):
+    # Regression: /auth/login is not behind require_auth, so the profile
+    # SELECT after sign-in must run with the token from the fresh
+    # session bound on flask.g — with the anon key it matches zero rows
+    # under RLS and every valid login turns into a 401.
+    from flask import g
+
+    from controllers import userController
+
+    profile = {
+        "id": "user-1",
+        "full_name": "Test User",
+        "email": "login-bind@example.com",
+        "company_id": None,
+        "role": "member",
+        "company": None,
+    }
+    seen = {}
+
+    def execute():
+        seen["token"] = getattr(g, "supabase_token", None)
+        return SimpleNamespace(data=profile)
+
+    query = mock.MagicMock()
+    query.select.return_value.eq.return_value.maybe_single.return_value.execute.side_effect = (
+        execute
+    )
+
+    session = mock.MagicMock(access_token="fresh-token")
+    session.model_dump.return_value = {
+        "access_token": "fresh-token",
+        "refresh_token": "fresh-refresh",
+    }
+    fake_supabase = mock.MagicMock()
+    fake_supabase.auth.sign_in_with_password.return_value = SimpleNamespace(
+        user=SimpleNamespace(
+            id="user-1", email="login-bind@example.com", user_metadata={}
+        ),
+        session=session,
+    )
+    fake_supabase.table.return_value = query
+
+    with mock.patch.object(userController, "supabase", fake_supabase):
+        response = client.post(
+            "/auth/login",
+            json={"email": "login-bind@example.com", "password": "secret"},
+        )
+
+    assert response.status_code == 200
+    assert seen["token"] == "fresh-token"
+    assert response.get_json()["user"]["id"] == "user-1"